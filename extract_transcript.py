@@ -1,11 +1,47 @@
 #!/usr/bin/env python3
 import os
 import sys
-import re
-import xml.etree.ElementTree as ET
 import argparse
+from concurrent.futures import ProcessPoolExecutor
+from typing import Iterable, Iterator, Optional
 
-def format_timestamp(seconds):
+try:
+    # lxml parses considerably faster than the standard library; fall back
+    # to ElementTree when it is not installed.
+    from lxml import etree as ET
+    HAVE_LXML = True
+    # Unlike ElementTree, lxml keeps comments and processing instructions as
+    # nodes, which splits the text around them in two. Drop them so the
+    # extracted text is the same with either parser.
+    _PARSE_OPTIONS = {'remove_comments': True, 'remove_pis': True}
+except ImportError:
+    import xml.etree.ElementTree as ET
+    HAVE_LXML = False
+    _PARSE_OPTIONS = {}
+
+if HAVE_LXML:
+    def _iter_spans(p, span_tag: str):
+        # lxml filters children by tag in C without building a list; the
+        # wildcard matches the qualified tag and any other namespace.
+        return p.iterchildren('{*}span')
+
+    # Parser settings shared by every file; huge_tree lifts libxml2's size
+    # limits for very long episodes.
+    _ITERPARSE_OPTIONS = dict(_PARSE_OPTIONS, huge_tree=True)
+else:
+    _ITERPARSE_OPTIONS = {}
+
+    def _iter_spans(p, span_tag: str):
+        # Walk the children directly instead of building a findall() list.
+        # The fully qualified tag is compared first; local-name matching is
+        # only used if the spans use some other namespace.
+        return (child for child in p
+                if child.tag == span_tag or _local_name(child.tag) == 'span')
+
+# Marks the episode identifier in paths in the Apple Podcasts cache.
+_PODCAST_MARKER = 'PodcastContent'
+
+def format_timestamp(seconds: float) -> str:
     """
     Converts a time in seconds to the format HH:MM:SS.
     
@@ -15,12 +51,11 @@ def format_timestamp(seconds):
     Returns:
         str: Time in the format "HH:MM:SS".
     """
-    h = int(seconds // 3600)
-    m = int((seconds % 3600) // 60)
-    s = int(seconds % 60)
+    m, s = divmod(int(seconds), 60)
+    h, m = divmod(m, 60)
     return f"{h:02d}:{m:02d}:{s:02d}"
 
-def parse_timecode(time_str):
+def parse_timecode(time_str: str) -> float:
     """
     Parses a timecode in the format H:MM:SS(.mmm) or M:SS(.mmm)
     and returns the total number of seconds.
@@ -32,27 +67,26 @@ def parse_timecode(time_str):
         float: Total seconds represented by the timecode.
     """
     try:
-        parts = time_str.split(':')
-        if len(parts) == 3:
+        colons = time_str.count(':')
+        if colons == 2:
             # Format: H:MM:SS(.mmm)
-            hours = int(parts[0])
-            minutes = int(parts[1])
-            seconds = float(parts[2])
-            return hours * 3600 + minutes * 60 + seconds
-        elif len(parts) == 2:
+            hours, minutes, seconds = time_str.split(':', 2)
+            return int(hours) * 3600 + int(minutes) * 60 + float(seconds)
+        if colons == 1:
             # Format: M:SS(.mmm)
-            minutes = int(parts[0])
-            seconds = float(parts[1])
-            return minutes * 60 + seconds
-        else:
-            # If no colon is found, assume it's just seconds.
-            return float(time_str)
+            minutes, seconds = time_str.split(':', 1)
+            return int(minutes) * 60 + float(seconds)
+        # If no colon is found, assume it's just seconds.
+        return float(time_str)
     except ValueError:
-        return 0
+        return 0.0
 
-def extract_text(element):
+def extract_text(element) -> str:
     """
-    Recursively extracts all text from an XML element and its children.
+    Extracts all text from an XML element and its children.
+    
+    Uses itertext() so the walk runs inside ElementTree instead of
+    recursing in Python.
     
     Args:
         element (xml.etree.ElementTree.Element): The XML element.
@@ -60,78 +94,165 @@ def extract_text(element):
     Returns:
         str: Combined text content.
     """
-    texts = []
-    if element.text:
-        texts.append(element.text)
-    for child in element:
-        texts.append(extract_text(child))
-        if child.tail:
-            texts.append(child.tail)
-    return " ".join(texts).strip()
+    return " ".join(t for t in element.itertext() if t).strip()
+
+def _paragraph_text(p, span_tag: str) -> str:
+    """
+    Joins the text of all <span> elements directly inside a <p> element.
+    
+    Args:
+        p (xml.etree.ElementTree.Element): The <p> element.
+        span_tag (str): Namespace-qualified <span> tag, e.g. "{ns}span".
+        
+    Returns:
+        str: The paragraph text, or "" if it has no <span> elements.
+    """
+    # Extract the text from each span, including nested ones, and join once.
+    parts = (extract_text(span) for span in _iter_spans(p, span_tag))
+    return " ".join(part for part in parts if part)
 
-def extract_transcript(ttml_content, output_path, include_timestamps=False):
+def _local_name(tag: str) -> str:
     """
-    Parses the TTML content, extracts subtitle text (with optional timestamps),
+    Strips the namespace from an element tag, e.g. "{ns}p" -> "p".
+    """
+    return tag.rpartition('}')[2]
+
+def _encoded_chunks(lines: Iterable[str]) -> Iterator[bytes]:
+    """
+    Yields UTF-8 encoded lines separated by blank lines.
+    
+    Args:
+        lines (iterable): Transcript paragraphs.
+        
+    Yields:
+        bytes: Alternating paragraphs and b"\\n\\n" separators.
+    """
+    it = iter(lines)
+    first = next(it, None)
+    if first is None:
+        return
+    yield first.encode("utf-8")
+    for line in it:
+        yield b"\n\n"
+        yield line.encode("utf-8")
+
+def extract_transcript(ttml_path: str, output_path: str, include_timestamps: bool = False) -> None:
+    """
+    Parses a TTML file, extracts subtitle text (with optional timestamps),
     and saves the transcript to a text file.
     
     This version mimics the JavaScript code by navigating to:
       tt -> body -> div -> p
     and then processing each <p> element.
     
+    The file is parsed incrementally: each <p> is converted as soon as it
+    has been read and then discarded, so memory use stays flat regardless
+    of episode length.
+    
     Args:
-        ttml_content (str): The TTML file content.
+        ttml_path (str): Path to the TTML file.
         output_path (str): Path to save the transcript.
         include_timestamps (bool): Whether to include timestamps.
+        
+    Raises:
+        OSError: If the TTML file cannot be read.
     """
+    transcript = []
+
+    # Track the open elements so we know when we are inside <tt><body><div>.
+    body = None
+    div = None
+    open_elements = []
+    body_tag = div_tag = p_tag = span_tag = None
+
+    # Bind hot callables to locals; this loop runs once per XML event.
+    push = open_elements.append
+    pop = open_elements.pop
+    append = transcript.append
+    local_name = _local_name
+    paragraph_text_of = _paragraph_text
+    parse = parse_timecode
+    fmt = format_timestamp
     try:
-        root = ET.fromstring(ttml_content)
+        with open(ttml_path, "rb") as f:
+            for event, elem in ET.iterparse(f, events=("start", "end"), **_ITERPARSE_OPTIONS):
+                if event == "start":
+                    parent = open_elements[-1] if open_elements else None
+                    push(elem)
+                    tag = elem.tag
+                    if parent is None:
+                        # Qualify the tags we look for with the root's
+                        # namespace once so they can be compared directly.
+                        ns = tag[:tag.index('}') + 1] if tag[:1] == '{' else ''
+                        body_tag = ns + 'body'
+                        div_tag = ns + 'div'
+                        p_tag = ns + 'p'
+                        span_tag = ns + 'span'
+                    elif body is None:
+                        if tag == body_tag or local_name(tag) == 'body':
+                            body = elem
+                    elif div is None and parent is body and (tag == div_tag or local_name(tag) == 'div'):
+                        div = elem
+                    continue
+
+                pop()
+                # Most end events are nested <span>s; reject those first.
+                # Only children of the first <div> are transcribed. Later
+                # elements are still parsed so malformed files are reported.
+                if div is None or not open_elements or open_elements[-1] is not div:
+                    continue
+
+                tag = elem.tag
+                if tag == p_tag or local_name(tag) == 'p':
+                    paragraph_text = paragraph_text_of(elem, span_tag)
+                    if paragraph_text:
+                        begin = elem.get('begin') if include_timestamps else None
+                        if begin is not None:
+                            append(f"[{fmt(parse(begin.strip()))}] {paragraph_text}")
+                        else:
+                            append(paragraph_text)
+
+                # Release the finished child of <div>.
+                elem.clear()
+                div.remove(elem)
     except ET.ParseError as e:
         print(f"XML parsing error: {e}")
         return
 
-    transcript = []
-
-    # Navigate to <tt><body><div>
-    body = root.find('.//{*}body')
     if body is None:
         print("No <body> element found in TTML.")
         return
-    div = body.find('{*}div')
     if div is None:
         print("No <div> element found in TTML.")
         return
 
-    paragraphs = div.findall('{*}p')
-    for p in paragraphs:
-        # Only process paragraphs that contain <span> elements.
-        span_elements = p.findall('{*}span')
-        if not span_elements:
-            continue
-
-        paragraph_text = ""
-        for span in span_elements:
-            # Recursively extract text from each span.
-            paragraph_text += extract_text(span) + " "
-        paragraph_text = paragraph_text.strip()
-
-        if paragraph_text:
-            if include_timestamps and 'begin' in p.attrib:
-                begin_time_str = p.attrib['begin'].strip()
-                seconds = parse_timecode(begin_time_str)
-                timestamp = format_timestamp(seconds)
-                transcript.append(f"[{timestamp}] {paragraph_text}")
-            else:
-                transcript.append(paragraph_text)
-
-    output_text = "\n\n".join(transcript)
     try:
-        with open(output_path, "w", encoding="utf-8") as f:
-            f.write(output_text)
+        # Stream the paragraphs rather than joining one large string; the
+        # buffered writer coalesces them into a few large write calls.
+        # Encoding here and writing bytes skips the text-mode I/O layer.
+        with open(output_path, "wb", buffering=1 << 20) as f:
+            f.writelines(_encoded_chunks(transcript))
         print(f"Transcript saved to {output_path}")
     except Exception as e:
         print(f"Error writing to {output_path}: {e}")
 
-def find_ttml_files(directory):
+def _podcast_id(path: str) -> Optional[str]:
+    """
+    Extracts the identifier following "PodcastContent" in a path.
+    
+    Args:
+        path (str): A path or single path component.
+        
+    Returns:
+        str or None: The identifier, or None if the path has none.
+    """
+    idx = path.find(_PODCAST_MARKER)
+    if idx < 0:
+        return None
+    rest = path[idx + len(_PODCAST_MARKER):]
+    return rest.split('/', 1)[0].split('\\', 1)[0] or None
+
+def find_ttml_files(directory: str) -> list:
     """
     Recursively finds TTML files in a directory.
     
@@ -142,17 +263,47 @@ def find_ttml_files(directory):
         list: List of dictionaries with 'path' and extracted 'id' for each TTML file.
     """
     ttml_files = []
-    for root_dir, _, files in os.walk(directory):
-        for file in files:
-            if file.endswith(".ttml"):
-                full_path = os.path.join(root_dir, file)
-                match = re.search(r'PodcastContent([^/\\]+)', full_path)
-                if match:
-                    file_id = match.group(1)
-                    ttml_files.append({'path': full_path, 'id': file_id})
+    # Each pending directory carries its identifier, computed once when it
+    # is first seen; subdirectories inherit it from their parent.
+    pending = [(directory, _podcast_id(directory))]
+    while pending:
+        current, dir_id = pending.pop()
+        try:
+            entries = os.scandir(current)
+        except OSError:
+            # Unreadable or missing directories are skipped, like os.walk().
+            continue
+        subdirs = []
+        with entries:
+            for entry in entries:
+                if entry.is_dir(follow_symlinks=False):
+                    child_id = dir_id if dir_id is not None else _podcast_id(entry.name)
+                    subdirs.append((entry.path, child_id))
+                elif entry.name.endswith(".ttml"):
+                    file_id = dir_id if dir_id is not None else _podcast_id(entry.name)
+                    if file_id is not None:
+                        ttml_files.append({'path': entry.path, 'id': file_id})
+        # Reversed so the stack pops them in scandir order. This keeps the
+        # os.walk() top-down order, on which the batch "-N" suffixes depend.
+        pending.extend(reversed(subdirs))
     return ttml_files
 
-def main():
+def process_file(job: tuple) -> None:
+    """
+    Extracts the transcript of a single TTML file.
+    
+    Runs in a worker process during batch mode.
+    
+    Args:
+        job (tuple): (ttml_path, output_path, include_timestamps).
+    """
+    ttml_path, output_path, include_timestamps = job
+    try:
+        extract_transcript(ttml_path, output_path, include_timestamps)
+    except OSError as e:
+        print(f"Error reading {ttml_path}: {e}")
+
+def main() -> None:
     parser = argparse.ArgumentParser(
         description="Extracts subtitles from TTML files and saves them as text files."
     )
@@ -171,12 +322,10 @@ def main():
     if args.input_file and args.output_file:
         # Single file mode.
         try:
-            with open(args.input_file, "r", encoding="utf-8") as f:
-                ttml_content = f.read()
-        except Exception as e:
+            extract_transcript(args.input_file, args.output_file, include_timestamps)
+        except OSError as e:
             print(f"Error reading {args.input_file}: {e}")
             sys.exit(1)
-        extract_transcript(ttml_content, args.output_file, include_timestamps)
     else:
         # Batch mode: process all TTML files in a fixed directory.
         ttml_base_dir = os.path.join(
@@ -187,22 +336,21 @@ def main():
         files = find_ttml_files(ttml_base_dir)
         print(f"Found {len(files)} TTML files")
 
-        # To avoid filename collisions.
+        # To avoid filename collisions. Output names are assigned here, in
+        # the main process, so they do not depend on worker scheduling.
         filename_counts = {}
+        jobs = []
         for file in files:
             base_filename = file['id']
             count = filename_counts.get(base_filename, 0)
             suffix = "" if count == 0 else f"-{count}"
             output_path = os.path.join(transcripts_dir, f"{base_filename}{suffix}.txt")
             filename_counts[base_filename] = count + 1
+            jobs.append((file['path'], output_path, include_timestamps))
 
-            try:
-                with open(file['path'], "r", encoding="utf-8") as f:
-                    ttml_content = f.read()
-            except Exception as e:
-                print(f"Error reading {file['path']}: {e}")
-                continue
-            extract_transcript(ttml_content, output_path, include_timestamps)
+        # Each file is independent, so spread parsing across all cores.
+        with ProcessPoolExecutor() as executor:
+            list(executor.map(process_file, jobs, chunksize=32))
 
 if __name__ == "__main__":
     main()